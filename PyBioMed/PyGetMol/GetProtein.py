@@ -276,10 +276,9 @@ def GetProteinSequence(ProteinID):
 
     ID = str(ProteinID)
     localfile = urlopen("http://www.uniprot.org/uniprot/" + ID + ".fasta")
-    temp = localfile.readlines()
-    res = ""
-    for i in range(1, len(temp)):
-        res = res + temp[i].strip()
+    temp = localfile.read().decode("utf-8").splitlines()
+    localfile.close()
+    res = "".join(line.strip() for line in temp[1:])
     return res
 
 
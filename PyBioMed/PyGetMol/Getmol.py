@@ -17,25 +17,56 @@ Date: 2016.06.04
 Email: gadsby@163.com
 """
 
-try:
-    # Python 3
-    from urllib.request import urlopen, Request
-except ImportError:
-    # Python 2
-    from urllib2 import urlopen, Request
 # Core Library modules
+import asyncio
+import csv
 import os
 import re
 import string
-import pybel
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 
 # Third party modules
+import requests
 from rdkit import Chem
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-Version = 1.0
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
+Version = 1.0
 
-def ReadMolFromSDF(filename=""):
+# Ask for compressed pages: the SDF/HTML texts shrink several times and both
+# requests and aiohttp decompress them transparently.
+_HEADERS = {"User-Agent": "Mozilla/5.0", "Accept-Encoding": "gzip, deflate"}
+
+# One session for all the web fetchers, so that back-to-back queries reuse
+# the pooled connections instead of paying a new DNS lookup and handshake.
+_SESSION = requests.Session()
+_SESSION.headers.update(_HEADERS)
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    raise_on_status=False,
+)
+_POOL_SIZE = 20
+_SESSION.mount("http://", HTTPAdapter(pool_maxsize=_POOL_SIZE, max_retries=_RETRY))
+_SESSION.mount("https://", HTTPAdapter(pool_maxsize=_POOL_SIZE, max_retries=_RETRY))
+
+# (connect, read) timeouts in seconds, so a hanging server cannot block a
+# caller or a bulk download forever.
+_TIMEOUT = (5, 30)
+
+
+def ReadMolFromSDF(filename="", lazy=False, sanitize=True, removeHs=True):
     """
     Read a set of molecules by SDF file format.
 
@@ -43,53 +74,99 @@ def ReadMolFromSDF(filename=""):
 
     You need to use for statement to call each object.
 
+    With lazy=True the molecules are streamed from the file one by one
+
+    (ForwardSDMolSupplier), which avoids indexing the whole file first but
+
+    does not support len() or random access.
+
+    With sanitize=False the chemistry perception (rings, aromaticity,
+
+    valences) is skipped, which makes parsing much faster; call
+
+    Chem.SanitizeMol on the molecules if later code relies on it.
+
     Usage:
 
         res=ReadMolFromSDF(filename)
 
+        for mol in ReadMolFromSDF(filename, lazy=True): ...
+
         Input: filename is a file name with path.
 
         Output: res is a set of molecular object.
 
     """
-    molset = Chem.SDMolSupplier(filename)
+    if lazy:
+        # Opened here so that a missing file fails at the call, not later
+        return _IterMolsFromSDF(open(filename, "rb"), sanitize, removeHs)
+    molset = Chem.SDMolSupplier(filename, sanitize=sanitize, removeHs=removeHs)
     return molset
 
 
-def ReadMolFromMOL(filename=""):
+def _IterMolsFromSDF(f, sanitize, removeHs):
+    with f:
+        for mol in Chem.ForwardSDMolSupplier(f, sanitize=sanitize, removeHs=removeHs):
+            yield mol
+
+
+def ReadMolFromSmile(smi=""):
     """
-    Read a  molecule by mol file format.
+    #################################################################
+    Read a molecule by SMILES string.
 
-    Usage:
+    Note: parsed molecules are cached by input string, and each call
 
-        res=ReadMolFromMOL(filename)
+    returns a fresh copy of the cached molecule.
 
-        Input: filename is a file name with path.
+    Usage:
 
-        Output: res is a  molecular object.
+        res=ReadMolFromSmile(smi)
 
+        Input: smi is a SMILES string.
+
+        Output: res is a molecule object.
+    #################################################################
     """
-    mol = Chem.MolFromMolFile(filename)
+    mol = _MolFromSmiles(smi.strip())
+    if mol is not None:
+        mol = Chem.Mol(mol)
+
     return mol
 
 
-def ReadMolFromSmile(smi=""):
+@lru_cache(maxsize=4096)
+def _MolFromSmiles(smi):
+    return Chem.MolFromSmiles(smi)
+
+
+def GetCanonicalSmiles(smi=""):
     """
     #################################################################
-    Read a molecule by SMILES string.
+    Get the canonical isomeric SMILES of a SMILES string.
+
+    Note: the results are cached, so canonicalizing the same SMILES
+
+    again (e.g. for logging or deduplication) costs a dict lookup.
 
     Usage:
 
-        res=ReadMolFromSmile(smi)
+        res=GetCanonicalSmiles(smi)
 
         Input: smi is a SMILES string.
 
-        Output: res is a molecule object.
+        Output: res is the canonical SMILES, or None if smi is invalid.
     #################################################################
     """
-    mol = Chem.MolFromSmiles(smi.strip())
+    return _CanonicalSmiles(smi.strip())
 
-    return mol
+
+@lru_cache(maxsize=8192)
+def _CanonicalSmiles(smi):
+    mol = _MolFromSmiles(smi)
+    if mol is None:
+        return None
+    return Chem.MolToSmiles(mol, isomericSmiles=True)
 
 
 def ReadMolFromInchi(inchi=""):
@@ -97,6 +174,10 @@ def ReadMolFromInchi(inchi=""):
     #################################################################
     Read a molecule by Inchi string.
 
+    Note: parsed molecules are cached by input string, and each call
+
+    returns a fresh copy of the cached molecule.
+
     Usage:
 
         res=ReadMolFromInchi(inchi)
@@ -106,15 +187,18 @@ def ReadMolFromInchi(inchi=""):
         Output: res is a molecule object.
     #################################################################
     """
-    from openbabel import pybel
-
-    temp = pybel.readstring("inchi", inchi)
-    smi = temp.write("smi")
-    mol = Chem.MolFromSmiles(smi.strip())
+    mol = _MolFromInchi(inchi.strip())
+    if mol is not None:
+        mol = Chem.Mol(mol)
 
     return mol
 
 
+@lru_cache(maxsize=4096)
+def _MolFromInchi(inchi):
+    return Chem.MolFromInchi(inchi)
+
+
 def ReadMolFromMol(filename=""):
     """
     #################################################################
@@ -124,56 +208,183 @@ def ReadMolFromMol(filename=""):
 
         res=ReadMolFromMol(filename)
 
-        Input: filename is a file name.
+        Input: filename is a file name or path, or the content of a mol file
+
+        as a string or bytes (anything containing a line break).
 
         Output: res is a molecule object.
     #################################################################
     """
-    mol = Chem.MolFromMolFile(filename)
+    if isinstance(filename, bytes):
+        filename = filename.decode("utf-8")
+    if isinstance(filename, str) and ("\n" in filename or "\r" in filename):
+        return Chem.MolFromMolBlock(filename)
+    mol = Chem.MolFromMolFile(os.fspath(filename))
     return mol
 
 
+ReadMolFromMOL = ReadMolFromMol
+
+
 #############################################################################
 
-def GetMolFromCAS(casid=""):
+_CAS_URL = "http://www.chemnet.com/cas/supplier.cgi?terms={0}&l=&exact=dict"
+_NCBI_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{0}/SDF"
+_NCBI_SMILES_URL = (
+    "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{0}"
+    "/property/CanonicalSMILES/CSV"
+)
+_DRUGBANK_URL = "http://www.drugbank.ca/drugs/{0}.sdf"
+_KEGG_URL = "https://www.genome.jp/dbget-bin/www_bget?-f+m+drug+{0}"
+
+_INCHI_RE = re.compile(r'<td align="left">(InChI=[^<]+)</td>')
+
+# Checked before any request is made, so malformed IDs fail without a round trip.
+_CAS_RE = re.compile(r"^[0-9]{1,7}-[0-9]{2}-[0-9]$")
+_CID_RE = re.compile(r"^[0-9]+$")
+_DRUGBANK_RE = re.compile(r"^DB[0-9]{5}$")
+_KEGG_RE = re.compile(r"^D[0-9]{5}$")
+
+
+def _CheckID(ID, pattern, name):
+    """
+    Strip an identifier and raise ValueError if it does not match pattern.
+    """
+    ID = str(ID).strip()
+    if pattern.match(ID) is None:
+        raise ValueError(f"{ID!r} is not a valid {name}.")
+    return ID
+
+
+def _CheckCID(cid):
+    """
+    Check a PubChem CID and drop its leading zeros, as PubChem does.
+    """
+    return str(int(_CheckID(cid, _CID_RE, "PubChem CID")))
+
+
+def _CheckKID(kid):
+    """
+    Check a KEGG drug ID, accepting it in lower case as KEGG does.
+    """
+    return _CheckID(str(kid).upper(), _KEGG_RE, "KEGG drug ID")
+
+
+def _GetText(link):
+    """
+    Download a page through the shared session and return its text.
+    """
+    r = _SESSION.get(link, timeout=_TIMEOUT)
+    r.raise_for_status()
+    # Decode once as UTF-8: r.text would guess the charset of SDF responses
+    # by scanning the whole body.
+    return r.content.decode("utf-8", "replace")
+
+
+def _MolFromCASPage(text, casid=""):
+    """
+    Extract the InChI string from a chemnet page and convert it to a molecule.
     """
-    Download molecules from http://www.chemnet.com/cas/ using CAS ID (casid).
-    Requires OpenBabel's pybel module.
-    """
-    casid = casid.strip()
-    
-    # Download page from chemnet
-    link = f"http://www.chemnet.com/cas/supplier.cgi?terms={casid}&l=&exact=dict"
-    localfile = urlopen(link)
-    
-    # Read and decode the content
-    temp = [line.decode('utf-8') for line in localfile.readlines()]
-    
-    # Close the connection
-    localfile.close()
-    
     # Search for the InChI string in the page content
-    res = None
-    for i in temp:
-        if "InChI=" in i:  # Check if the line contains "InChI="
-            k = i.split('<td align="left">')
-            kk = k[1].split("</td>\r\n")
-            if kk[0].startswith("InChI"):
-                res = kk[0].strip()
-                break
-    
-    # Error handling if no InChI is found
-    if res is None:
+    m = _INCHI_RE.search(text)
+    if m is None:
         raise ValueError(f"InChI string not found for CAS ID {casid}.")
-    
-    # Convert the InChI string to a molecule using pybel
-    #mol = pybel.readstring("inchi", res)
-    mol = pybel.Molecule(res)  # Use the Molecule constructor directly
-    
-    # Convert the molecule to SMILES format
-    smile = mol.write("smi").strip()
-    
-    return smile
+    res = m.group(1).strip()
+
+    mol = Chem.MolFromInchi(res)
+    if mol is None:
+        raise ValueError(f"RDKit could not parse the InChI string for CAS ID {casid}.")
+
+    return mol
+
+
+def _MolFromMolText(text):
+    """
+    Convert the content of a downloaded SDF/MOL file to a molecule.
+    """
+    m = Chem.MolFromMolBlock(text)
+    if m is None:
+        raise ValueError("RDKit could not load the molecule from the SDF file.")
+
+    return m
+
+
+# Molecules downloaded by the fetchers, keyed on canonical SMILES, so that
+# different IDs of the same structure (e.g. a CAS ID and a cid) end up
+# sharing one parsed molecule. Bounded, least recently used entries go first;
+# the GetMolFrom* functions refresh their molecule on every call, also when
+# the result comes from their own lru_cache.
+_MOL_CACHE = OrderedDict()
+_MOL_CACHE_SIZE = 10000
+_MOL_CACHE_LOCK = threading.Lock()
+
+
+def _CacheMol(smi, mol):
+    """
+    Add mol to _MOL_CACHE under smi (or mark it as recently used) and return smi.
+    """
+    with _MOL_CACHE_LOCK:
+        _MOL_CACHE.setdefault(smi, mol)
+        _MOL_CACHE.move_to_end(smi)
+        if len(_MOL_CACHE) > _MOL_CACHE_SIZE:
+            _MOL_CACHE.popitem(last=False)
+    return smi
+
+
+def _SmilesFromMol(mol):
+    """
+    Return the canonical isomeric SMILES of mol and add mol to _MOL_CACHE.
+    """
+    return _CacheMol(Chem.MolToSmiles(mol, isomericSmiles=True), mol)
+
+
+def _LookupCachedMol(smi):
+    with _MOL_CACHE_LOCK:
+        mol = _MOL_CACHE.get(smi)
+        if mol is not None:
+            _MOL_CACHE.move_to_end(smi)
+    return mol
+
+
+def GetCachedMol(smiles=""):
+    """
+    Get the molecule object behind a SMILES returned by the GetMolFrom*
+
+    functions without parsing it again.
+
+    Usage:
+
+        res=GetCachedMol(GetMolFromNCBI("2244"))
+
+        Input: smiles is a SMILES string.
+
+        Output: res is a copy of the cached molecule object, or None if no
+
+        fetched molecule has this SMILES.
+    """
+    smi = smiles.strip()
+    mol = _LookupCachedMol(smi)
+    if mol is None:
+        # Not in canonical form, e.g. typed by hand
+        canonical = GetCanonicalSmiles(smi)
+        if canonical is not None and canonical != smi:
+            mol = _LookupCachedMol(canonical)
+    if mol is None:
+        return None
+    return Chem.Mol(mol)
+
+
+def GetMolFromCAS(casid=""):
+    """
+    Download molecules from http://www.chemnet.com/cas/ using CAS ID (casid).
+    """
+    return _CacheMol(*_GetMolFromCAS(_CheckID(casid, _CAS_RE, "CAS ID")))
+
+
+@lru_cache(maxsize=4096)
+def _GetMolFromCAS(casid):
+    mol = _MolFromCASPage(_GetText(_CAS_URL.format(casid)), casid)
+    return Chem.MolToSmiles(mol, isomericSmiles=True), mol
 
 
 def GetMolFromEBI():
@@ -184,99 +395,408 @@ def GetMolFromEBI():
 
 def GetMolFromNCBI(cid=""):
     """
-    Downloading the molecules from http://pubchem.ncbi.nlm.nih.gov/ by cid (cid).
+    Downloading the molecules from https://pubchem.ncbi.nlm.nih.gov/ by cid (cid).
     """
-    cid = cid.strip()
-    localfile = urlopen(
-        "http://pubchem.ncbi.nlm.nih.gov/summary/summary.cgi?cid="
-        + cid
-        + "&disopt=SaveSDF"
-    )
-    temp = localfile.readlines()
-    f = file("temp.sdf", "w")
-    f.writelines(temp)
-    f.close()
-    localfile.close()
-    m = Chem.MolFromMolFile("temp.sdf")
-    os.remove("temp.sdf")
-    temp = Chem.MolToSmiles(m, isomericSmiles=True)
-    return temp
+    return _CacheMol(*_GetMolFromNCBI(_CheckCID(cid)))
+
+
+@lru_cache(maxsize=4096)
+def _GetMolFromNCBI(cid):
+    mol = _MolFromMolText(_GetText(_NCBI_URL.format(cid)))
+    return Chem.MolToSmiles(mol, isomericSmiles=True), mol
 
 
 def GetMolFromDrugbank(dbid=""):
     """
     Downloading the molecules from http://www.drugbank.ca/ by dbid (dbid).
     """
-    dbid = dbid.strip()
-    link = "http://www.drugbank.ca/drugs/" + dbid + ".sdf"
-    
-    # Create a request with headers
-    req = Request(link, headers={'User-Agent': 'Mozilla/5.0'})
-    localfile = urlopen(req)
-    lines = localfile.readlines()
-    #print(lines)
-    # Read and decode the contents of the file
-    temp = [line.decode('utf-8') for line in lines]  # Decode each line
-    #print(temp)
-    with open("temp.sdf", "w") as f:
-        f.write("".join(temp))  # Join the list into a single string and write it to the file
-    
-    # Close the files
-    f.close()
-    localfile.close()
-    
-    # Check if the file was written successfully
-    if os.path.getsize("temp.sdf") == 0:
-        raise ValueError("The downloaded SDF file is empty or corrupted.")
-    
-    # Load the molecule using RDKit
-    m = Chem.MolFromMolFile("temp.sdf")
-    
-    #print(f"extracted data: {m}")
-    
-    # Check if the molecule was successfully loaded
-    if m is None:
-        raise ValueError("RDKit could not load the molecule from the SDF file.")
-    
-    # Convert the molecule to SMILES
-    temp = Chem.MolToSmiles(m, isomericSmiles=True)
-    
-    # Remove the temporary SDF file
-    os.remove("temp.sdf")
-    
-    return temp
+    return _CacheMol(*_GetMolFromDrugbank(_CheckID(dbid, _DRUGBANK_RE, "Drugbank ID")))
+
+
+@lru_cache(maxsize=4096)
+def _GetMolFromDrugbank(dbid):
+    mol = _MolFromMolText(_GetText(_DRUGBANK_URL.format(dbid)))
+    return Chem.MolToSmiles(mol, isomericSmiles=True), mol
+
 
 def GetMolFromKegg(kid=""):
     """
-    Downloading the molecules from http://www.genome.jp/ by kegg id (kid).
-    """
-    ID = str(kid)
-    link = urlopen("http://www.genome.jp/dbget-bin/www_bget?-f+m+drug+" + ID)
-    #temp = localfile.readlines()
-    #f = open("temp.mol", "w")
-    #f.writelines(temp)
-    #f.close()
-    #localfile.close()
-    # Create a request with headers
-
-    req = Request(link, headers={'User-Agent': 'Mozilla/5.0'})
-    localfile = urlopen(req)
-    lines = localfile.readlines()
-    #print(lines)
-    # Read and decode the contents of the file
-    temp = [line.decode('utf-8') for line in lines]  # Decode each line
-    #print(temp)
-    with open("temp.sdf", "w") as f:
-        f.write("".join(temp))  # Join the list into a single string and write it to the file
-    
-    # Close the files
-    f.close()
-    localfile.close()
-
-    m = Chem.MolFromMolFile("temp.mol")
-    os.remove("temp.mol")
-    temp = Chem.MolToSmiles(m, isomericSmiles=True)
-    return temp
+    Downloading the molecules from https://www.genome.jp/ by kegg id (kid).
+    """
+    return _CacheMol(*_GetMolFromKegg(_CheckKID(kid)))
+
+
+@lru_cache(maxsize=4096)
+def _GetMolFromKegg(kid):
+    mol = _MolFromMolText(_GetText(_KEGG_URL.format(kid)))
+    return Chem.MolToSmiles(mol, isomericSmiles=True), mol
+
+
+#############################################################################
+# Bulk downloads: the pages of the distinct IDs of a batch are requested
+# concurrently, at most _MAX_CONCURRENT at a time, and then converted to
+# SMILES in order.
+
+_MAX_CONCURRENT = 5
+
+
+def _RetryDelay(headers, attempt):
+    """
+    Seconds to wait before retrying after failed attempt number attempt (from 0).
+
+    This is the server's Retry-After if it sent one, otherwise the backoff
+
+    urllib3 uses for _RETRY (no wait before the first retry, then
+
+    backoff_factor * 2 ** attempt), capped at Retry.DEFAULT_BACKOFF_MAX.
+    """
+    delay = _RETRY.backoff_factor * 2**attempt if attempt else 0
+    retry_after = headers.get("Retry-After", "").strip()
+    if retry_after.isdigit():
+        delay = int(retry_after)
+    elif retry_after:
+        try:
+            date = parsedate_to_datetime(retry_after)
+            delay = max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return min(delay, Retry.DEFAULT_BACKOFF_MAX)
+
+
+async def _FetchText(session, semaphore, link):
+    """
+    Download a page with aiohttp, waiting for a free slot first.
+
+    Connection errors and the statuses in _RETRY.status_forcelist are retried
+
+    up to _RETRY.total times. The slot is released while waiting to retry.
+    """
+    for attempt in range(_RETRY.total + 1):
+        last = attempt == _RETRY.total
+        async with semaphore:
+            try:
+                async with session.get(link) as r:
+                    if last or r.status not in _RETRY.status_forcelist:
+                        r.raise_for_status()
+                        return (await r.read()).decode("utf-8", "replace")
+                    delay = _RetryDelay(r.headers, attempt)
+            except aiohttp.ClientConnectionError:
+                if last:
+                    raise
+                delay = _RetryDelay({}, attempt)
+        await asyncio.sleep(delay)
+
+
+async def _FetchAllText(links):
+    """
+    Download all the pages concurrently and return their texts in order.
+
+    If one download fails, the others are cancelled and the error is raised.
+    """
+    if aiohttp is None:
+        raise ImportError("The bulk download functions require aiohttp.")
+    semaphore = asyncio.Semaphore(_MAX_CONCURRENT)
+    timeout = aiohttp.ClientTimeout(sock_connect=_TIMEOUT[0], sock_read=_TIMEOUT[1])
+    async with aiohttp.ClientSession(headers=_HEADERS, timeout=timeout) as session:
+        tasks = [
+            asyncio.ensure_future(_FetchText(session, semaphore, link))
+            for link in links
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+async def _GetMolsAsync(ids, link, parse):
+    """
+    Download the page of each distinct ID once, convert it to a molecule with
+
+    parse(text, ID) and return the SMILES in the order of ids.
+    """
+    unique = list(dict.fromkeys(ids))
+    texts = await _FetchAllText([link.format(ID) for ID in unique])
+    smiles = {ID: _SmilesFromMol(parse(text, ID)) for ID, text in zip(unique, texts)}
+    return [smiles[ID] for ID in ids]
+
+
+async def GetMolsFromCASAsync(casids=()):
+    """
+    Download a list of molecules from http://www.chemnet.com/cas/ by CAS ID.
+
+    Note: if one download fails, the whole batch fails with its error.
+
+    Usage:
+
+        res=await GetMolsFromCASAsync(casids)
+
+        Input: casids is a list of CAS IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    casids = [_CheckID(casid, _CAS_RE, "CAS ID") for casid in casids]
+    return await _GetMolsAsync(casids, _CAS_URL, _MolFromCASPage)
+
+
+async def GetMolsFromNCBIAsync(cids=()):
+    """
+    Download a list of molecules from https://pubchem.ncbi.nlm.nih.gov/ by cid.
+
+    Note: if one download fails, the whole batch fails with its error.
+
+    Usage:
+
+        res=await GetMolsFromNCBIAsync(cids)
+
+        Input: cids is a list of compound IDs (CID).
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    cids = [_CheckCID(cid) for cid in cids]
+    return await _GetMolsAsync(cids, _NCBI_URL, lambda text, cid: _MolFromMolText(text))
+
+
+async def GetMolsFromDrugbankAsync(dbids=()):
+    """
+    Download a list of molecules from http://www.drugbank.ca/ by dbid.
+
+    Note: if one download fails, the whole batch fails with its error.
+
+    Usage:
+
+        res=await GetMolsFromDrugbankAsync(dbids)
+
+        Input: dbids is a list of Drugbank IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    dbids = [_CheckID(dbid, _DRUGBANK_RE, "Drugbank ID") for dbid in dbids]
+    return await _GetMolsAsync(
+        dbids, _DRUGBANK_URL, lambda text, dbid: _MolFromMolText(text)
+    )
+
+
+async def GetMolsFromKeggAsync(kids=()):
+    """
+    Download a list of molecules from https://www.genome.jp/ by kegg id.
+
+    Note: if one download fails, the whole batch fails with its error.
+
+    Usage:
+
+        res=await GetMolsFromKeggAsync(kids)
+
+        Input: kids is a list of KEGG drug IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    kids = [_CheckKID(kid) for kid in kids]
+    return await _GetMolsAsync(kids, _KEGG_URL, lambda text, kid: _MolFromMolText(text))
+
+
+# Synchronous versions of the functions above; they cannot be called from a
+# running event loop, await the *Async functions there instead.
+
+
+def _RunAsync(func, ids):
+    """
+    Run the coroutine function func on ids from synchronous code.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(func(ids))
+    raise RuntimeError(
+        f"{func.__name__[:-5]} cannot be called from a running event loop, "
+        f"use await {func.__name__}(...) instead."
+    )
+
+
+def GetMolsFromCAS(casids=()):
+    """
+    Download a list of molecules from http://www.chemnet.com/cas/ by CAS ID.
+
+    Usage:
+
+        res=GetMolsFromCAS(casids)
+
+        Input: casids is a list of CAS IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _RunAsync(GetMolsFromCASAsync, casids)
+
+
+def GetMolsFromNCBI(cids=()):
+    """
+    Download a list of molecules from https://pubchem.ncbi.nlm.nih.gov/ by cid.
+
+    Usage:
+
+        res=GetMolsFromNCBI(cids)
+
+        Input: cids is a list of compound IDs (CID).
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _RunAsync(GetMolsFromNCBIAsync, cids)
+
+
+# PubChem accepts a comma-separated list of CIDs in one PUG-REST request.
+_NCBI_BATCH_SIZE = 100
+
+
+def GetSmilesFromNCBI(cids=()):
+    """
+    Download the canonical SMILES computed by PubChem for a list of cids.
+
+    The cids are sent in batches of 100 per request and no SDF is parsed,
+
+    so this is much faster than GetMolsFromNCBI when only SMILES are needed.
+
+    Note: PubChem's canonical SMILES carry no stereochemistry.
+
+    Usage:
+
+        res=GetSmilesFromNCBI(cids)
+
+        Input: cids is a list of compound IDs (CID).
+
+        Output: res is a list of SMILES strings in the same order (None for
+
+        a cid which PubChem did not return).
+    """
+    cids = [_CheckCID(cid) for cid in cids]
+    unique = list(dict.fromkeys(cids))
+    smiles = {}
+    for start in range(0, len(unique), _NCBI_BATCH_SIZE):
+        batch = unique[start : start + _NCBI_BATCH_SIZE]
+        try:
+            text = _GetText(_NCBI_SMILES_URL.format(",".join(batch)))
+        except requests.HTTPError as e:
+            # PubChem answers 404 when none of the cids exist
+            if e.response is not None and e.response.status_code == 404:
+                continue
+            raise
+        rows = csv.reader(text.splitlines())
+        next(rows, None)  # skip the header
+        for row in rows:
+            smiles[row[0]] = row[1]
+    return [smiles.get(cid) for cid in cids]
+
+
+def GetMolsFromDrugbank(dbids=()):
+    """
+    Download a list of molecules from http://www.drugbank.ca/ by dbid.
+
+    Usage:
+
+        res=GetMolsFromDrugbank(dbids)
+
+        Input: dbids is a list of Drugbank IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _RunAsync(GetMolsFromDrugbankAsync, dbids)
+
+
+def GetMolsFromKegg(kids=()):
+    """
+    Download a list of molecules from https://www.genome.jp/ by kegg id.
+
+    Usage:
+
+        res=GetMolsFromKegg(kids)
+
+        Input: kids is a list of KEGG drug IDs.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _RunAsync(GetMolsFromKeggAsync, kids)
+
+
+#############################################################################
+# Threaded bulk downloads, for synchronous code without aiohttp or inside a
+# running event loop where it cannot await. The worker threads share the
+# session's connection pool, so there are never more workers than pooled
+# connections; extra workers would make urllib3 discard connections.
+
+
+def _GetMolsThreaded(func, ids, max_workers):
+    max_workers = min(max_workers, _POOL_SIZE)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, ids))
+
+
+def GetMolsFromCASThreaded(casids=(), max_workers=8):
+    """
+    Download a list of molecules by CAS ID using a pool of threads.
+
+    Usage:
+
+        res=GetMolsFromCASThreaded(casids, max_workers=8)
+
+        Input: casids is a list of CAS IDs.
+
+        max_workers is the number of threads, at most 20.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _GetMolsThreaded(GetMolFromCAS, casids, max_workers)
+
+
+def GetMolsFromNCBIThreaded(cids=(), max_workers=8):
+    """
+    Download a list of molecules by cid using a pool of threads.
+
+    Usage:
+
+        res=GetMolsFromNCBIThreaded(cids, max_workers=8)
+
+        Input: cids is a list of compound IDs (CID).
+
+        max_workers is the number of threads, at most 20.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _GetMolsThreaded(GetMolFromNCBI, cids, max_workers)
+
+
+def GetMolsFromDrugbankThreaded(dbids=(), max_workers=8):
+    """
+    Download a list of molecules by Drugbank ID using a pool of threads.
+
+    Usage:
+
+        res=GetMolsFromDrugbankThreaded(dbids, max_workers=8)
+
+        Input: dbids is a list of Drugbank IDs.
+
+        max_workers is the number of threads, at most 20.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _GetMolsThreaded(GetMolFromDrugbank, dbids, max_workers)
+
+
+def GetMolsFromKeggThreaded(kids=(), max_workers=8):
+    """
+    Download a list of molecules by kegg id using a pool of threads.
+
+    Usage:
+
+        res=GetMolsFromKeggThreaded(kids, max_workers=8)
+
+        Input: kids is a list of KEGG drug IDs.
+
+        max_workers is the number of threads, at most 20.
+
+        Output: res is a list of SMILES strings in the same order.
+    """
+    return _GetMolsThreaded(GetMolFromKegg, kids, max_workers)
 
 
 #############################################################################
@@ -284,24 +804,19 @@ def GetMolFromKegg(kid=""):
 if __name__ == "__main__":
     print("-" * 10 + "START" + "-" * 10)
     print("Only PyBioMed is successfully installed the code below can be run！")
-    from PyBioMed.PyGetMol.GetProtein import timelimited
 
-    @timelimited(10)
     def run_GetMolFromCAS():
         temp = GetMolFromCAS(casid="50-12-4")
         print(temp)
 
-    @timelimited(10)
     def run_GetMolFromNCBI():
         temp = GetMolFromNCBI(cid="2244")
         print(temp)
 
-    @timelimited(10)
     def run_GetMolFromDrugbank():
         temp = GetMolFromDrugbank(dbid="DB00133")
         print(temp)
 
-    @timelimited(10)
     def run_GetMolFromKegg():
         temp = GetMolFromKegg(kid="D02176")
         print(temp)
@@ -141,11 +141,7 @@ class PyMolecule:
             Output: res is a molecule object.
         #################################################################
         """
-        from openbabel import pybel
-
-        temp = pybel.readstring("inchi", inchi)
-        smi = temp.write("smi")
-        self.mol = Chem.MolFromSmiles(smi.strip())
+        self.mol = Chem.MolFromInchi(inchi.strip())
 
         return self.mol
 
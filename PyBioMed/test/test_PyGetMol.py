@@ -14,16 +14,34 @@ Date: 2016.06.14
 
 Email: gadsby@163.com
 """
+# Core Library modules
+import asyncio
+import os
+import pathlib
+
 # Third party modules
 import pytest
+import requests
+from rdkit import Chem
+from urllib3.util.retry import Retry
 
 # First party modules
+from PyBioMed.PyGetMol import Getmol
 from PyBioMed.PyGetMol.GetDNA import GetDNAFromUniGene
 from PyBioMed.PyGetMol.Getmol import (
+    GetCachedMol,
+    GetCanonicalSmiles,
     GetMolFromCAS,
     GetMolFromDrugbank,
     GetMolFromKegg,
     GetMolFromNCBI,
+    GetMolsFromNCBI,
+    GetMolsFromNCBIAsync,
+    GetMolsFromNCBIThreaded,
+    GetSmilesFromNCBI,
+    ReadMolFromInchi,
+    ReadMolFromMol,
+    ReadMolFromSDF,
 )
 from PyBioMed.PyGetMol.GetProtein import GetPDB, GetSeqFromPDB
 
@@ -93,5 +111,214 @@ def test_pygetmol():
     print("-" * 10 + "END" + "-" * 10)
 
 
+def test_readmol():
+    filename = os.path.join(os.path.dirname(__file__), "test_data", "drug.sdf")
+
+    mols = ReadMolFromSDF(filename)
+    lazy_mols = list(ReadMolFromSDF(filename, lazy=True))
+    assert len(lazy_mols) == len(mols) == 5
+    assert [m.GetNumAtoms() for m in lazy_mols] == [m.GetNumAtoms() for m in mols]
+    raw_mols = list(ReadMolFromSDF(filename, lazy=True, sanitize=False))
+    assert len(raw_mols) == 5
+    with pytest.raises(OSError):
+        ReadMolFromSDF(os.path.join(os.path.dirname(filename), "nope.sdf"), lazy=True)
+
+    filename = os.path.join(os.path.dirname(__file__), "test_data", "test.mol")
+    with open(filename) as f:
+        block = f.read()
+    mol = ReadMolFromMol(filename)
+    assert ReadMolFromMol(block).GetNumAtoms() == mol.GetNumAtoms()
+    assert ReadMolFromMol(block.encode()).GetNumAtoms() == mol.GetNumAtoms()
+    assert ReadMolFromMol(pathlib.Path(filename)).GetNumAtoms() == mol.GetNumAtoms()
+
+    assert GetCanonicalSmiles("OCC") == GetCanonicalSmiles(" CCO ") == "CCO"
+    assert GetCanonicalSmiles("not a smiles") is None
+
+    inchi = "InChI=1S/C2H6O/c1-2-3/h3H,2H2,1H3"
+    assert Chem.MolToSmiles(ReadMolFromInchi(inchi)) == "CCO"
+
+
+def test_invalid_ids():
+    # Malformed IDs are rejected before any request is made
+    for func, ID in [
+        (GetMolFromCAS, "50124"),
+        (GetMolFromNCBI, "CID2244"),
+        (GetMolFromDrugbank, "00133"),
+        (GetMolFromKegg, "C00031"),
+        (GetMolFromCAS, "５０-１２-４"),
+        (GetMolFromNCBI, "２２４４"),
+    ]:
+        with pytest.raises(ValueError):
+            func(ID)
+    assert Getmol._CheckKID(" d02176") == "D02176"
+
+
+def test_cas_page():
+    page = (
+        '<tr><td>InChI</td><td align="left">InChI=1S/C9H8O4/c1-6(10)13-8-5-3-2-4-7'
+        "(8)9(11)12/h2-5H,1H3,(H,11,12)</td>\r\n</tr>"
+    )
+    mol = Getmol._MolFromCASPage(page, "50-78-2")
+    assert Chem.MolToSmiles(mol) == "CC(=O)Oc1ccccc1C(=O)O"
+    with pytest.raises(ValueError):
+        Getmol._MolFromCASPage("<html>No results</html>", "50-78-2")
+
+
+def test_getmols_order(monkeypatch):
+    blocks = {
+        "1": Chem.MolToMolBlock(Chem.MolFromSmiles("CCO")),
+        "2": Chem.MolToMolBlock(Chem.MolFromSmiles("c1ccccc1")),
+    }
+    links = []
+
+    async def fake_fetch_all_text(urls):
+        links.extend(urls)
+        return [blocks[url.split("/")[-2]] for url in urls]
+
+    monkeypatch.setattr(Getmol, "_FetchAllText", fake_fetch_all_text)
+    res = GetMolsFromNCBI(["2", "1", " 2"])
+    assert res == ["c1ccccc1", "CCO", "c1ccccc1"]
+    # Duplicate IDs are downloaded once
+    assert len(links) == 2
+
+    async def in_event_loop():
+        assert await GetMolsFromNCBIAsync(["1"]) == ["CCO"]
+        with pytest.raises(RuntimeError):
+            GetMolsFromNCBI(["1"])
+
+    asyncio.run(in_event_loop())
+
+
+def test_getmols_cancel(monkeypatch):
+    cancelled = []
+
+    async def fake_fetch_text(session, semaphore, link):
+        if link.endswith("/1/SDF"):
+            raise ValueError("broken page")
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(link)
+            raise
+
+    monkeypatch.setattr(Getmol, "_FetchText", fake_fetch_text)
+    # One failed download cancels the others instead of leaving them running
+    with pytest.raises(ValueError):
+        GetMolsFromNCBI(["1", "2", "3"])
+    assert len(cancelled) == 2
+
+
+def test_getmols_threaded(monkeypatch):
+    blocks = {
+        "1": Chem.MolToMolBlock(Chem.MolFromSmiles("CCO")),
+        "2": Chem.MolToMolBlock(Chem.MolFromSmiles("c1ccccc1")),
+    }
+    workers = []
+
+    class RecordingExecutor(Getmol.ThreadPoolExecutor):
+        def __init__(self, max_workers):
+            workers.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    monkeypatch.setattr(Getmol, "ThreadPoolExecutor", RecordingExecutor)
+    monkeypatch.setattr(Getmol, "_GetText", lambda link: blocks[link.split("/")[-2]])
+    Getmol._GetMolFromNCBI.cache_clear()
+    res = GetMolsFromNCBIThreaded(["2", "1", "2"], max_workers=50)
+    assert res == ["c1ccccc1", "CCO", "c1ccccc1"]
+    # Never more workers than pooled connections
+    assert workers == [Getmol._POOL_SIZE]
+    Getmol._GetMolFromNCBI.cache_clear()
+
+
+def test_getsmiles_ncbi(monkeypatch):
+    links = []
+
+    def fake_get_text(url):
+        links.append(url)
+        if "/cid/9999/" in url:
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.HTTPError(response=response)
+        return '"CID","CanonicalSMILES"\n702,"CCO"\n2244,"CC(=O)OC1=CC=CC=C1C(=O)O"\n'
+
+    monkeypatch.setattr(Getmol, "_GetText", fake_get_text)
+    res = GetSmilesFromNCBI(["0702", 2244, "5", "702"])
+    assert res == ["CCO", "CC(=O)OC1=CC=CC=C1C(=O)O", None, "CCO"]
+    assert links[0].split("/")[-4] == "702,2244,5"
+    # A batch in which no cid exists maps to None
+    assert GetSmilesFromNCBI(["9999"]) == [None]
+
+
+def test_cached_mol(monkeypatch):
+    mol = Chem.MolFromSmiles("OCC(=O)O")
+    smi = Getmol._SmilesFromMol(mol)
+    assert smi == "O=C(O)CO"
+    for key in [smi, "C(O)C(=O)O"]:
+        cached = GetCachedMol(key)
+        assert Chem.MolToSmiles(cached) == smi
+        assert cached is not mol
+    assert GetCachedMol("CCCCCCCCCCCCCCCCCC") is None
+
+    # A fetcher answered from its own lru_cache puts the molecule back
+    block = Chem.MolToMolBlock(Chem.MolFromSmiles("CCN"))
+    monkeypatch.setattr(Getmol, "_GetText", lambda link: block)
+    Getmol._GetMolFromNCBI.cache_clear()
+    smi = GetMolFromNCBI("6341")
+    Getmol._MOL_CACHE.clear()
+    assert GetMolFromNCBI("6341") == smi
+    assert GetCachedMol(smi) is not None
+    Getmol._GetMolFromNCBI.cache_clear()
+
+
+def test_fetch_retry(monkeypatch):
+    class FakeResponse:
+        def __init__(self, status, headers=None):
+            self.status = status
+            self.headers = headers or {}
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        def raise_for_status(self):
+            assert self.status == 200
+
+        async def read(self):
+            return b"page"
+
+    class FakeSession:
+        def __init__(self, responses):
+            self.responses = responses
+
+        def get(self, link):
+            return self.responses.pop(0)
+
+    responses = [FakeResponse(429, {"Retry-After": "86400"}), FakeResponse(200)]
+    delays = []
+
+    async def fetch():
+        semaphore = asyncio.Semaphore(1)
+
+        async def fake_sleep(delay):
+            # The slot is free while waiting to retry
+            assert not semaphore.locked()
+            delays.append(delay)
+
+        monkeypatch.setattr(Getmol.asyncio, "sleep", fake_sleep)
+        return await Getmol._FetchText(FakeSession(responses), semaphore, "link")
+
+    # A transient 429 is retried instead of failing the whole batch
+    assert asyncio.run(fetch()) == "page"
+    assert responses == []
+    # A huge Retry-After is capped
+    assert delays == [Retry.DEFAULT_BACKOFF_MAX]
+    assert [Getmol._RetryDelay({}, attempt) for attempt in range(3)] == [0, 1.0, 2.0]
+
+
 if __name__ == "__main__":
     test_pygetmol()
+    test_readmol()
+    test_invalid_ids()
+    test_cas_page()